@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""Compare compiled --where predicates against the old per-row interpreter
+
+Usage:
+  python benchmarks/filter_benchmark.py [<repeat>]
+"""
+import os
+import sys
+import time
+
+from tsel import Tsel
+from tsel.readers import SNIFF_LINES
+from tsel.where import compile_where
+
+SAMPLE = os.path.join(os.path.dirname(__file__), '..', 'sample-data',
+                      'gcloud-compute-machine-types.list')
+
+WHERES = [
+    ('ZONE', '!=', 'us-central1-a'),
+    ('CPUS', '>=', '16'),
+    ('MEMORY_GB', '<', '400'),
+]
+
+
+def interpret(tsel, line, row):
+    # The loop Tsel.filter used before predicates were compiled
+    matches = True
+    for col, cmp, val in tsel.wheres:
+        if col is None:
+            matches &= (val in line)
+        elif cmp == '=' or cmp == '==':
+            matches &= (row[tsel.columns[col][0]] == val)
+        elif cmp == '!=' or cmp == '<>':
+            matches &= (row[tsel.columns[col][0]] != val)
+        elif cmp == '<':
+            matches &= (tsel.compare(row[tsel.columns[col][0]], val) < 0)
+        elif cmp == '<=':
+            matches &= (tsel.compare(row[tsel.columns[col][0]], val) <= 0)
+        elif cmp == '>':
+            matches &= (tsel.compare(row[tsel.columns[col][0]], val) > 0)
+        elif cmp == '>=':
+            matches &= (tsel.compare(row[tsel.columns[col][0]], val) >= 0)
+    return matches
+
+
+def bench(name, records, matches):
+    start = time.perf_counter()
+    count = sum(1 for record in records if matches(record))
+    elapsed = time.perf_counter() - start
+    print(f'{name: <12}{len(records) / elapsed: >12,.0f} rows/s  {count} matches')
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    with open(SAMPLE, encoding='UTF-8') as file:
+        lines = file.read().splitlines()
+
+    tsel = Tsel()
+    tsel.open_reader(lines[:SNIFF_LINES])
+    tsel.wheres = WHERES
+    records = list(tsel.reader.rows(lines[1:] * repeat))
+
+    bench('interpreted', records, lambda record: interpret(tsel, *record))
+    bench('compiled', records,
+          compile_where([tsel.reader.record_test(w) for w in tsel.wheres]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import random
+import re
+import unittest
+import warnings
+
+from tsel.where import regex_test, required_literal
+
+
+class RequiredLiteralTest(unittest.TestCase):
+
+    def assert_required(self, pattern, text):
+        # Every match has to contain the literal, or the prefilter drops it
+        if re.search(pattern, text):
+            self.assertIn(required_literal(pattern), text, pattern)
+
+    def test_literals(self):
+        self.assertEqual(required_literal('^foo.*bar$'), 'foo')
+        self.assertEqual(required_literal(r'ab\.cd'), 'ab.cd')
+        self.assertEqual(required_literal('abcd?'), 'abc')
+        self.assertEqual(required_literal('a|bcd'), '')
+
+    def test_escapes(self):
+        for pattern, text in [(r'\x41BC', 'ABC'), (r'\101', 'A'),
+                              (r'ABC', 'ABC'), (r'\U00000041BC', 'ABC'),
+                              (r'\N{LATIN CAPITAL LETTER A}BC', 'ABC'),
+                              (r'(a)\1bc', 'aabc'), (r'\0', '\0')]:
+            self.assert_required(pattern, text)
+            self.assertTrue(regex_test('~', pattern)(text), pattern)
+
+    def test_classes(self):
+        for pattern, text in [('[^]]x', 'ax'), (r'[\]a]b', ']b'),
+                              ('[]a]b', ']b'), ('[^a]]x', 'b]x'),
+                              (r'[\\]x', '\\x'), ('[x', None)]:
+            if text is None:
+                self.assertEqual(required_literal(pattern), '')
+            else:
+                self.assert_required(pattern, text)
+                self.assertTrue(regex_test('~', pattern)(text), pattern)
+
+    def test_random_patterns(self):
+        tokens = ['a', 'b', 'c', ']', '.', '*', '+', '?', '^', '$', '[', '[^',
+                  '(', ')', '{2}', '{1,2}', r'\]', r'\.', r'\d', r'\x61',
+                  r'\142', r'\1', r'\\', '|']
+        rand = random.Random(1)
+        for _ in range(20000):
+            pattern = ''.join(rand.choice(tokens)
+                              for _ in range(rand.randint(1, 8)))
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    re.compile(pattern)
+            except re.error:
+                continue
+            for _ in range(10):
+                text = ''.join(rand.choice('abc].\\1')
+                               for _ in range(rand.randint(0, 8)))
+                self.assert_required(pattern, text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,28 +9,59 @@ Usage:
 
 Options:
   -h, --help             Show this screen.
+  -c, --cache            Cache parsed files in ~/.cache/tsel, to load them
+                         quickly again while they are unchanged.
   -d, --debug            Print debug information.
-  -f, --file=FILE        Read from file [default: -].
+  -f, --file=FILE        Read from file [default: -]. Columns of JSON and
+                         logfmt input are the keys in its first 100 records,
+                         or in all of them with -i or --cache.
   -i, --interactive      Enable interactive mode.
-  -o, --order-by=COLUMN  Sort output by COLUMN.
+  -j, --jobs=N           Parse input files in N processes when streaming, not
+                         when loading them for -i or --cache [default: 1].
+  -l, --limit=N          Show at most N rows, the first N by --order-by.
+  --any                  Show rows matching any of the patterns, not all.
+  -o, --order-by=COLUMN  Sort output by COLUMN, a comma separated list where
+                         -COLUMN sorts in descending order.
+  -p, --patterns=FILE    Match rows against patterns read from FILE, one per
+                         line, as well as <pattern>.
   -s, --select=COLUMNS   Select column names [Default: ALL].
+  --sort-memory=SIZE     Memory used for sorting before spilling rows to
+                         temporary files [default: 256M].
   -v, --verbose          Give more output. Option is additive, and can be used
   -V, --version          Show version.
-  -w, --where COL=Value  Show only rows matching predicate.
+  -w, --where COL=Value  Show only rows matching predicate. Predicates can be
+                         combined with and, or, not and parentheses, e.g.
+                         "STATUS=Running and (RESTARTS>3 or not ROLES=master)".
+                         COL~REGEX and COL!~REGEX match regular expressions.
 """
 from docopt import docopt
 
+from array import array
 import curses
-import csv
+import itertools
 import os
 import re
 import sys
 
+from tsel import bitset, cache
+from tsel.parallel import parallel_rows
+from tsel.readers import (SAMPLE_ROWS, SNIFF_LINES, KeyValueReader,
+                          compressed, is_json_document, json_items,
+                          map_lines, open_reader, read_lines)
+from tsel.sort import (MIN_SORT_MEMORY, external_sort, format_order,
+                       order_rows, parse_order, parse_size, row_getter,
+                       sort_key)
+from tsel.table import DictColumn, Table
+from tsel.where import (INDEXED, REGEX, clauses, comparator, compile_node,
+                        compile_where, format_where, is_clause, is_pattern,
+                        key_test, natural_key, parse_where, pattern_test)
+
 HELP_SCREEN = """
                    SUMMARY OF TSEL COMMANDS
 
   s                    Select and/or rearrange columns
   w                    Where filter - Set your filter condition
+  x                    Remove the last added filter
   h  ?                 Display this help.
   q                    Exit.
  ---------------------------------------------------------------------------
@@ -49,20 +80,29 @@ HELP_SCREEN = """
 from importlib import metadata
 # from time import sleep
 
-multiple_spaces = re.compile('  +')
-comparitors = re.compile('(<>|<=?|>=?|!=|==?)')
-numeric = re.compile('([0-9]+)')
+SORT_MEMORY = '256M'
+JOBS = 1
+
 
 
 class Tsel:
     def __init__(self):
         self.headerline = ''
-        self.lines = []
         self.columns = dict()
-        self.rows = []
+        self.data = Table([])
+        self.bits_cache = dict()
+        self.filtered_bits = 0
+        self.filtered_wheres = []
         self.filtered_rows = []
         self.select_columns = []
         self.wheres = []
+        self.order_by = []
+        self.limit = None
+        self.sort_memory = parse_size(SORT_MEMORY)
+        self.jobs = JOBS
+        self.splittable = False
+        self.use_cache = False
+        self.infile = '-'
         self.quit = False
         self.is_interactive = False
 
@@ -75,125 +115,165 @@ class Tsel:
             command.append(f"--select='{csv}'")
         if self.wheres:
             for where in self.wheres:
-                col, cmp, val = where
-                if col is None:
-                    command.append(f"--where='{val}'")
-                else:
-                    command.append(f"--where='{col}{cmp}{val}'")
+                command.append(f"--where='{format_where(where)}'")
+        if self.order_by:
+            command.append(f"--order-by='{format_order(self.order_by)}'")
+        if self.limit is not None:
+            command.append(f"--limit={self.limit}")
 
         print(" ".join(command))
 
 
-    def load_infile(self, infile):
-        lines = None
-        if infile == '-':
-            lines = sys.stdin.read().splitlines()
-        else:
-            with open(infile, 'r', encoding='UTF-8') as file:
-                lines = file.read().splitlines()
-
-        headerline = lines[0]
-
-        tokens = multiple_spaces.split(headerline)
-
-        # TODO: format as Enum ??
-        input_format = 0
-        if len(tokens) > 1:
-            input_format = 1
-        else:
-            tokens = ",".split(headerline)
-
-            if len(tokens) > 1:
-                input_format = 2
-
-        column_names = tokens  # multiple_spaces.split(self.headerline)
-
+    def open_reader(self, lines):
+        # Sniff the format from the first lines, returning the lines
+        # holding data
+        self.reader = open_reader(lines)
+        self.headerline = self.reader.headerline
+        self.columns = self.reader.layout()
+        return lines[self.reader.header_lines:]
 
-        if not len(column_names) == len(set(column_names)):
-            raise NotImplementedError("Duplicate column names not supported")
 
-        if input_format == 1:
-            self.headerline = lines.pop(0)
-            self.lines = lines
-            self.load_tabular(column_names)
-        else:
-            self.load_csv(lines)
+    def read_infile(self, infile):
+        lines = read_lines(infile)
+        prefix = list(itertools.islice(lines, SNIFF_LINES))
 
+        # Only uncompressed files of lines can be split between --jobs
+        self.splittable = (infile != '-' and os.path.isfile(infile) and
+                           not compressed(infile))
 
-    def load_csv(self, lines):
+        # JSON documents are read as JSON Lines, one line per item
+        if is_json_document(prefix):
+            self.splittable = False
+            lines = self.json_items(infile, itertools.chain(prefix, lines))
+            prefix = list(itertools.islice(lines, SNIFF_LINES))
 
-        reader = csv.DictReader(lines)
+        prefix = self.open_reader(prefix)
+        return itertools.chain(prefix, lines)
 
-        widths = []
 
-        self.rows = []
-        # [ [r1v1, r1v2, r1v3], [r2v1, r2v2, r2v3], ...]
-        for row in reader:
-            if not self.columns:
-                # column[column_name] = (index, start, stop)
-                self.columns = {}
-                for index, key in enumerate(row.keys()):
-                    self.columns[key] = (index, 0, 0)
-                    widths.append(len(key)+2)
+    def json_items(self, infile, lines):
+        try:
+            yield from json_items(lines)
+        except ValueError as e:
+            print(f"Invalid JSON in '{infile}': {e}", file=sys.stderr)
+            exit(1)
 
-            row = list(row.values())
 
-            for index, value in enumerate(row):
-                if len(value) + 2 > widths[index]:
-                    widths[index] = len(value) + 2
+    def load_infile(self, infile):
+        self.bits_cache = dict()
+        self.filtered_wheres = []
+
+        if self.use_cache and infile != '-':
+            cached = cache.load(infile)
+            if cached is None:
+                self.parse_infile(infile)
+                cache.save(infile, self.reader, self.data)
+            else:
+                self.reader, self.data = cached
+                self.headerline = self.reader.headerline
+                self.columns = self.reader.layout()
+        else:
+            self.parse_infile(infile)
+
+
+    def parse_infile(self, infile):
+        # Sniff the format first, so files are only indexed when rows can
+        # be split out of their lines on demand
+        lines = self.read_infile(infile)
+        if self.reader.random_access:
+            mapped = map_lines(infile)
+            if mapped is not None:
+                # Leave the file mapped and split rows out on demand
+                self.reader.widen_to(mapped.max_length)
+                self.columns = self.reader.layout()
+                self.data = Table(self.reader.names, mapped, self.reader)
+                return
 
-            self.rows.append(row)
+        # Other formats are parsed record by record
+        if isinstance(self.reader, KeyValueReader):
+            # Every record is loaded, so every key can be a column
+            records = self.reader.rows(lines, grow=True)
+        else:
+            records = self.reader.rows(lines)
 
+        self.data = Table(self.reader.names)
+        for line, row in records:
+            if len(row) > len(self.data.names):
+                self.data.extend(self.reader.names[len(self.data.names):])
+            self.reader.widen(line, row)
+            self.data.append(line, row)
 
-        for col in self.columns:
-            idx, start, _ = self.columns[col]
-            self.columns[col] = (idx, start, widths[idx])
+        self.columns = self.reader.layout()
 
 
-    def load_tabular(self, column_names):
-        # Work out column name => (start, end) character indices
-        columns = dict()
-        start = 0
-        c = None
-        while len(column_names):
-            c = column_names.pop(0)
+    def stream(self, lines):
+        parallel = self.jobs > 1 and self.splittable
 
-            if len(column_names):
-                c2 = column_names[0]
-                stop = self.headerline.index(c2, start + len(c))
+        if self.reader.random_access:
+            # Only split out the columns that are shown or sorted on
+            names = list(dict.fromkeys(self.select_columns +
+                                       [name for name, _ in self.order_by]))
+            indexes = [self.columns[name][0] for name in names]
+        else:
+            names = self.reader.names
+            indexes = None
+
+        if parallel:
+            rows = parallel_rows(self.infile, self.reader, self.wheres,
+                                 indexes, self.jobs)
+            self.columns = self.reader.layout()
+        elif self.reader.random_access:
+            if self.reader.sample_widths:
+                # Size the last column from the first lines, as output starts
+                # before the rest are read
+                sample = list(itertools.islice(lines, SAMPLE_ROWS))
+                for line in sample:
+                    self.reader.widen_to(len(line))
+                self.columns = self.reader.layout()
+                lines = itertools.chain(sample, lines)
+
+            if self.wheres:
+                # Fixed width fields can be tested on the raw lines, so only
+                # the lines that match are split into rows
+                matches = compile_where([compile_node(w, self.reader.line_test)
+                                         for w in self.wheres])
+                lines = filter(matches, lines)
+            rows = (row for line, row in self.reader.rows(lines, indexes))
+        else:
+            records = self.reader.rows(lines)
+
+            if self.reader.sample_widths:
+                sample = list(itertools.islice(records, SAMPLE_ROWS))
+                for line, row in sample:
+                    self.reader.widen(line, row)
+                self.columns = self.reader.layout()
+                records = itertools.chain(sample, records)
+
+            matches = compile_where([compile_node(w, self.reader.record_test)
+                                     for w in self.wheres])
+            rows = (row for line, row in filter(matches, records))
+
+        positions = {name: i for i, name in enumerate(names)}
+        if self.order_by:
+            key, reverse = sort_key([(row_getter(positions[name]), desc)
+                                     for name, desc in self.order_by])
+            if self.limit is None:
+                rows = external_sort(rows, key, reverse, self.sort_memory)
             else:
-                stop = len(self.headerline)
+                rows = order_rows(rows, key, reverse, self.limit)
+        elif self.limit is not None:
+            rows = itertools.islice(rows, self.limit)
 
-            columns[c] = (len(columns), start, stop)
-            start = stop
+        if names != self.select_columns:
+            indexes = [positions[name] for name in self.select_columns]
+            rows = ([row[i] for i in indexes] for row in rows)
 
-        # Get last column width from data
-        max_length = start
-        for line in self.lines:
-            max_length = max(max_length, len(line))
-        columns[c] = (columns[c][0], columns[c][1], max_length + 2)
-
-        self.columns = columns
-
-        rows = []
-        for line in self.lines:
-            row = []
-            for col in columns:
-                _, start, stop = columns[col]
-                row.append(line[start:stop].strip())
-            rows.append(row)
-        self.rows = rows
+        self.table(rows=rows)
 
 
     def compare(self, s1, s2):
-        a1 = numeric.split(s1)
-        for i, v in enumerate(a1):
-            if v.isdigit():
-                a1[i] = int(v)
-        a2 = numeric.split(s2)
-        for i, v in enumerate(a2):
-            if v.isdigit():
-                a2[i] = int(v)
+        a1 = natural_key(s1)
+        a2 = natural_key(s2)
 
         if a1 < a2:
             return -1
@@ -203,35 +283,136 @@ class Tsel:
         return 0
 
 
-    def filter(self):
-        self.filtered_rows = []
+    def row_test(self, where):
+        col, cmp, val = where
+
+        if col is None:
+            lines = self.data.lines
+            test = pattern_test(cmp, val)
+            return lambda rid: test(lines[rid])
+
+        cells = self.data.column(col)
+        if isinstance(cells, DictColumn):
+            codes = cells.codes
+            if cmp in ('=', '==', '!=', '<>'):
+                # Compare codes rather than strings
+                code = cells.code(val)
+                if cmp == '=' or cmp == '==':
+                    return lambda rid: codes[rid] == code
+                return lambda rid: codes[rid] != code
+
+            # Compare each distinct value once
+            if cmp in REGEX:
+                test = comparator(cmp, val)
+                hits = [test(value) for value in cells.values]
+            else:
+                test = key_test(cmp, val)
+                hits = [test(key) for key in cells.keys()]
+            return lambda rid: hits[codes[rid]]
+
+        if cmp in ('=', '==', '!=', '<>') or cmp in REGEX:
+            test = comparator(cmp, val)
+            return lambda rid: test(cells[rid])
+
+        keys = self.data.keys(col)
+        test = key_test(cmp, val)
+        return lambda rid: test(keys[rid])
+
+
+    def where_bits(self, where):
+        # Bitset of the rows matching one clause, cached so clauses can be
+        # recombined cheaply as filters are added and removed
+        if where in self.bits_cache:
+            return self.bits_cache[where]
+
+        size = len(self.data)
+        if not any(cmp in INDEXED for _, cmp, _ in clauses(where)):
+            # Nothing to look up, so test every row against the whole where
+            rids = filter(compile_node(where, self.row_test), range(size))
+            bits = bitset.from_rids(rids, size)
+        elif not is_clause(where):
+            op, arg = where
+            if op == 'not':
+                bits = bitset.full(size) & ~self.where_bits(arg)
+            elif op == 'and':
+                bits = bitset.full(size)
+                for w in arg:
+                    bits &= self.where_bits(w)
+            else:
+                bits = 0
+                for w in arg:
+                    bits |= self.where_bits(w)
+        else:
+            col, cmp, val = where
+            if cmp in ('=', '=='):
+                rids = self.data.postings(col, val)
+                bits = bitset.from_rids(rids, size)
+            elif cmp in ('<', '<=', '>', '>='):
+                rids = self.data.sorted_index(col).range(cmp, val)
+                bits = bitset.from_rids(rids, size)
+            else:
+                # != is whatever = isn't
+                bits = bitset.full(size) & ~self.where_bits((col, '=', val))
 
-        for i, row in enumerate(self.rows):
-            matches = True
+        self.bits_cache[where] = bits
+        return bits
 
-            for where in self.wheres:
-                col, cmp, val = where
 
-                if col is None:
-                    line = self.lines[i]
-                    matches &= (val in line)
+    def narrow(self, bits, where):
+        # Clauses answered from an index are cheap to cache in full, others
+        # are only scanned over the rows still left in bits
+        indexed = all(cmp in INDEXED for _, cmp, _ in clauses(where))
+        if where in self.bits_cache or indexed:
+            return bits & self.where_bits(where)
+
+        size = len(self.data)
+        matches = compile_node(where, self.row_test)
+        rids = filter(matches, bitset.to_rids(bits, size))
+        return bitset.from_rids(rids, size)
 
+
+    def filter(self):
+        size = len(self.data)
+        rids = range(size)
+
+        if self.wheres:
+            previous = self.filtered_wheres
+            if previous and all(where in self.wheres for where in previous):
+                # Only narrowing the current result
+                bits = self.filtered_bits
+                for where in self.wheres:
+                    if where not in previous:
+                        bits = self.narrow(bits, where)
+            else:
+                bits = bitset.full(size)
+                for where in self.wheres:
+                    bits &= self.where_bits(where)
+
+            self.filtered_bits = bits
+            self.filtered_wheres = list(self.wheres)
+            rids = bitset.to_rids(bits, size)
+        else:
+            self.filtered_wheres = []
+
+        if len(self.order_by) == 1 and not self.wheres:
+            # Already in order in the column's sorted index
+            name, desc = self.order_by[0]
+            rids = self.data.sorted_index(name).ordered(desc)
+        elif self.order_by:
+            getters = []
+            for name, desc in self.order_by:
+                ranks = self.data.ranks(name)
+                if desc:
+                    getters.append((lambda rid, ranks=ranks: -ranks[rid], False))
                 else:
-                    if cmp == '=' or cmp == '==':
-                        matches &= (row[self.columns[col][0]] == val)
-                    elif cmp == '!=' or cmp == '<>':
-                        matches &= (row[self.columns[col][0]] != val)
-                    elif cmp == '<':
-                        matches &= (self.compare(row[self.columns[col][0]], val) < 0)
-                    elif cmp == '<=':
-                        matches &= (self.compare(row[self.columns[col][0]], val) <= 0)
-                    elif cmp == '>':
-                        matches &= (self.compare(row[self.columns[col][0]], val) > 0)
-                    elif cmp == '>=':
-                        matches &= (self.compare(row[self.columns[col][0]], val) >= 0)
-
-            if matches:
-                self.filtered_rows.append(row)
+                    getters.append((ranks.__getitem__, False))
+            key, reverse = sort_key(getters)
+            rids = array('q', order_rows(rids, key, reverse, self.limit))
+
+        if self.limit is not None:
+            rids = rids[:self.limit]
+
+        self.filtered_rows = rids
 
 
     def main(self):
@@ -244,9 +425,16 @@ class Tsel:
             print(arguments)
 
         filename = arguments['--file']
-        self.load_infile(filename)
-
+        self.infile = filename
         self.is_interactive = arguments['--interactive']
+        self.use_cache = arguments['--cache']
+
+        # Non-interactive runs stream rows straight from input to output,
+        # unless the parsed table is cached
+        if self.is_interactive or self.use_cache:
+            self.load_infile(filename)
+        else:
+            lines = self.read_infile(filename)
 
         self.select_columns = arguments['--select']
         if (not self.select_columns) or self.select_columns == 'ALL':
@@ -255,39 +443,102 @@ class Tsel:
             self.select_columns = [c.strip()
                                    for c in self.select_columns.split(',')]
 
-        self.filtered_rows = list(self.rows)
-
         self.wheres = []
         wheres = arguments['--where']
 
+        patterns = []
         pattern = arguments['<pattern>']
         if pattern:
-            self.wheres.insert(0, (None, None, pattern))
+            patterns.append((None, None, pattern))
+
+        patterns_file = arguments['--patterns']
+        if patterns_file:
+            try:
+                with open(patterns_file, 'r', encoding='UTF-8') as file:
+                    for line in file:
+                        line = line.rstrip('\r\n')
+                        if line:
+                            patterns.append((None, None, line))
+            except OSError as e:
+                print(f"Can't read --patterns file '{patterns_file}': {e.strerror}")
+                exit()
 
         for where in wheres:
-            parts = comparitors.split(where, 1)
-            # parts = where.split("=", 1)
-            # print(parts)
+            try:
+                where = parse_where(where)
+            except ValueError as e:
+                print(e)
+                exit()
 
-            # TODO process row filters before column filters
-            if len(parts) == 1:
-                filtered_rows = []
-                self.wheres.insert(0, (None, None, parts[0]))
+            for col, cmp, val in clauses(where):
+                if col is not None and col not in self.columns:
+                    print(f"Unknown column '{col}' found in --where")
+                    exit()
+                if cmp in REGEX:
+                    try:
+                        re.compile(val)
+                    except re.error as e:
+                        print(f"Invalid regex '{val}' found in --where: {e}")
+                        exit()
 
-            elif len(parts) == 3:
-                col, cmp, val = parts
+            # TODO process row filters before column filters
+            if where[0] == 'and':
+                for w in where[1]:
+                    if is_pattern(w):
+                        patterns.append(w)
+                    else:
+                        self.wheres.append(w)
+            elif is_pattern(where):
+                patterns.append(where)
+            else:
+                self.wheres.append(where)
+
+        # Patterns go first, grouped so they are matched in a single pass
+        if len(patterns) > 1:
+            op = 'or' if arguments['--any'] else 'and'
+            self.wheres.insert(0, (op, tuple(patterns)))
+        elif patterns:
+            self.wheres.insert(0, patterns[0])
+
+        order_by = arguments['--order-by']
+        if order_by:
+            self.order_by = parse_order(order_by)
+            for col, _ in self.order_by:
                 if col not in self.columns:
-                    print(f"Unknown column '{col}' found in --where")
+                    print(f"Unknown column '{col}' found in --order-by")
                     exit()
-                self.wheres.append((col, cmp, val))
 
-        self.filter()
+        limit = arguments['--limit']
+        if limit is not None:
+            if not limit.isdigit():
+                print(f"Invalid --limit '{limit}', expected a number of rows")
+                exit()
+            self.limit = int(limit)
+
+        try:
+            sort_memory = parse_size(arguments['--sort-memory'])
+        except ValueError:
+            sort_memory = 0
+        if sort_memory <= 0:
+            print(f"Invalid --sort-memory '{arguments['--sort-memory']}', expected a size like 512M")
+            exit()
+        self.sort_memory = max(sort_memory, MIN_SORT_MEMORY)
+
+        jobs = arguments['--jobs']
+        if not jobs.isdigit() or int(jobs) < 1:
+            print(f"Invalid --jobs '{jobs}', expected a number of processes")
+            exit()
+        self.jobs = int(jobs)
 
         if self.is_interactive:
+            self.filter()
             curses.wrapper(self.interactive)
             self.print_options()
-        else:
+        elif self.use_cache:
+            self.filter()
             self.table()
+        else:
+            self.stream(lines)
 
     def interactive(self, w):
 
@@ -307,7 +558,7 @@ class Tsel:
             maxr, maxc = w.getmaxyx()
             self.table(w.addstr, ri, 0, ri + maxr - 2, maxc - 2)
 
-            help = "s: select    w: where    ?: help    q: quit"
+            help = "s: select    w: where    x: drop filter    ?: help    q: quit"
             self.statusline(w, help, debug)
 
             ch = w.getch()
@@ -320,6 +571,10 @@ class Tsel:
                 self.select_prompt(w)
             elif ch == ord('w'):
                 self.where_prompt(w)
+            elif ch == ord('x'):
+                if self.wheres:
+                    self.wheres.pop()
+                    self.filter()
 
             # Down
             elif ch == ord('j'):
@@ -420,7 +675,7 @@ class Tsel:
                 w.addstr(0, 0, "Choose a value: ", curses.A_BOLD)
 
             msg = f"--where='{col}{cmp}{val}'"
-            help = "←→/hl: column/value dropdown   =/</>/!: Change comparison   Enter: Apply"
+            help = "←→/hl: column/value dropdown   =/</>/!/~: Change comparison   Enter: Apply   +: Add to filters"
             self.statusline(w, help, msg)
 
             for col in all_columns:
@@ -467,6 +722,11 @@ class Tsel:
                     cmp = f'{chr(prev_ch)}{chr(ch)}'
                 else:
                     cmp = '='
+            elif ch == ord('~'):
+                if prev_ch == ord('!'):
+                    cmp = '!~'
+                else:
+                    cmp = '~'
 
             if ch == ord('q'):
                 self.quit = True
@@ -496,11 +756,18 @@ class Tsel:
                 x -= 1
 
             # Back to table
-            if ch == 10:  # enter
+            if ch == 10 or ch == ord('+'):  # enter or +
                 if x == 1:
                     col = all_columns[selected_col]
                     val = distinct_values[selected_val]
-                    self.wheres = [(col, cmp, val)]
+                    if cmp in REGEX:
+                        # Values picked from the list match literally
+                        val = re.escape(val)
+                    where = (col, cmp, val)
+                    if ch == 10:
+                        self.wheres = [where]
+                    elif where not in self.wheres:
+                        self.wheres.append(where)
                     self.filter()
                 return
 
@@ -575,16 +842,15 @@ class Tsel:
 
 
     def distinct_values(self, col):
-        col_index = self.columns[col][0]
-        values = set([row[col_index] for row in self.rows])
+        values = self.data.distinct(col)
         values = list(values)
         values.sort()
         return values
 
 
-    def table(self, write=None, rmin=0, cmin=0, rmax=None, cmax=None):
+    def table(self, write=None, rmin=0, cmin=0, rmax=None, cmax=None, rows=None):
         if rmax is None:
-            rmax = 1 + len(self.filtered_rows)
+            rmax = sys.maxsize
         if cmax is None:
             cmax = sys.maxsize
 
@@ -606,21 +872,17 @@ class Tsel:
         write('\n')
 
         rmin = max(0, rmin)
-        rmin = min(rmin, 1+len(self.filtered_rows))
-        rmax = min(rmax, 1+len(self.filtered_rows))
 
-        ri = -1
+        if rows is None:
+            rids = self.filtered_rows[rmin:rmax]
+            rows = self.data.select(rids, self.select_columns)
+        else:
+            rows = itertools.islice(rows, rmin, rmax)
 
-        for row in self.filtered_rows:
+        for row in rows:
 
-            ri += 1
             ci = cmin
 
-            if ri < rmin:
-                continue
-            if ri >= rmax:
-                break
-
 #             if not self.select_columns:
 #                 write(line)
 #                 write('\n')
@@ -631,11 +893,11 @@ class Tsel:
 #                 if row[self.columns[col][0]] != val:
 #                     continue
 
-            for c in self.select_columns:
-                index, start, stop = self.columns[c]
+            for c, value in zip(self.select_columns, row):
+                _, start, stop = self.columns[c]
                 width = stop - start
                 if ci + width < cmax:
-                    write(f'{row[index]: <{width}}')
+                    write(f'{value: <{width}}')
                     ci += width
             write('\n')
 
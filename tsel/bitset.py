@@ -0,0 +1,25 @@
+from array import array
+
+# Offsets of the set bits in each possible byte value
+BYTE_BITS = [tuple(i for i in range(8) if byte >> i & 1) for byte in range(256)]
+
+
+def from_rids(rids, size):
+    # Bit i set means row id i is included
+    buf = bytearray((size + 7) // 8)
+    for rid in rids:
+        buf[rid >> 3] |= 1 << (rid & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def to_rids(bits, size):
+    rids = array('q')
+    for i, byte in enumerate(bits.to_bytes((size + 7) // 8, 'little')):
+        if byte:
+            base = i << 3
+            rids.extend([base + offset for offset in BYTE_BITS[byte]])
+    return rids
+
+
+def full(size):
+    return (1 << size) - 1
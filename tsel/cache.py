@@ -0,0 +1,55 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Bump when the pickled classes change, so old caches are parsed again
+CACHE_FORMAT = 2
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'tsel')
+
+
+def cache_path(infile):
+    key = hashlib.sha1(os.path.abspath(infile).encode('UTF-8')).hexdigest()
+    return os.path.join(cache_dir(), f'{key}.pickle')
+
+
+def fingerprint(infile):
+    stat = os.stat(infile)
+    return (CACHE_FORMAT, os.path.abspath(infile), stat.st_size, stat.st_mtime_ns)
+
+
+def load(infile):
+    # (reader, table) parsed from infile by an earlier run, or None when the
+    # file has changed since or isn't cached
+    try:
+        with open(cache_path(infile), 'rb') as file:
+            if pickle.load(file) != fingerprint(infile):
+                return None
+            return pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def save(infile, reader, table):
+    # Split out every column, so the cache holds the whole parsed table
+    for name in table.names:
+        table.column(name)
+
+    # Caching is only an optimisation, so failing to save is not an error
+    file = None
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir(), delete=False) as file:
+            pickle.dump(fingerprint(infile), file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump((reader, table), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, cache_path(infile))
+    except (OSError, pickle.PicklingError):
+        if file is not None:
+            try:
+                os.remove(file.name)
+            except OSError:
+                pass
@@ -0,0 +1,135 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import mmap
+import os
+
+from tsel.readers import SAMPLE_ROWS
+from tsel.where import compile_node, compile_where
+
+# Bytes of input each worker parses at a time
+CHUNK_SIZE = 2 << 20
+
+# Chunks submitted ahead per job, bounding how many are held in memory
+WINDOW = 2
+
+
+def split_chunks(infile, start, quoted=False, size=CHUNK_SIZE):
+    # (start, stop) byte ranges of the file from start on, each ending at the
+    # end of a line. With quoted, a line only ends a chunk after an even
+    # number of quotes, since newlines inside quoted fields don't end records.
+    end = os.path.getsize(infile)
+    chunks = []
+    if start >= end:
+        return chunks
+
+    with open(infile, 'rb') as file:
+        mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    with mm:
+        while start < end:
+            stop = min(start + size, end)
+            odd = quoted and mm[start:stop].count(b'"') % 2
+            while stop < end:
+                nl = mm.find(b'\n', stop)
+                if nl < 0:
+                    nl = end - 1
+                if quoted:
+                    odd ^= mm[stop:nl].count(b'"') % 2
+                stop = nl + 1
+                if not odd:
+                    break
+            chunks.append((start, stop))
+            start = stop
+    return chunks
+
+
+def read_chunk(infile, start, stop):
+    with open(infile, 'rb') as file:
+        file.seek(start)
+        data = file.read(stop - start)
+    lines = data.decode('UTF-8').split('\n')
+    if data.endswith(b'\n'):
+        lines.pop()
+    return [line.rstrip('\r') for line in lines]
+
+
+def parse_chunk(task):
+    # Rows of a chunk's lines that match wheres, and its first rows for
+    # sampling column widths
+    infile, start, stop, reader, wheres, indexes = task
+    lines = read_chunk(infile, start, stop)
+
+    if reader.random_access:
+        sample = [(line, None) for line in lines[:SAMPLE_ROWS]]
+        if wheres:
+            matches = compile_where([compile_node(w, reader.line_test)
+                                     for w in wheres])
+            lines = filter(matches, lines)
+        return [row for line, row in reader.rows(lines, indexes)], sample
+
+    records = list(reader.rows(iter(lines)))
+    sample = []
+    if reader.sample_widths:
+        sample = records[:SAMPLE_ROWS]
+    if wheres:
+        matches = compile_where([compile_node(w, reader.record_test)
+                                 for w in wheres])
+        records = filter(matches, records)
+    return [row for line, row in records], sample
+
+
+def parallel_rows(infile, reader, wheres, indexes, jobs):
+    # Rows of the records after any header that match wheres, parsed in jobs
+    # processes and yielded in input order. Column widths are sampled from
+    # the first records before returning, as they are when parsing serially.
+    with open(infile, 'rb') as file:
+        for _ in range(reader.header_lines):
+            file.readline()
+        start = file.tell()
+
+    quoted = reader.multiline_records
+    tasks = [(infile, chunk_start, chunk_stop, reader, wheres, indexes)
+             for chunk_start, chunk_stop in split_chunks(infile, start, quoted)]
+
+    pool = ProcessPoolExecutor(jobs)
+    chunks = ordered_results(pool, tasks, WINDOW * jobs)
+
+    parsed = []
+    if reader.sample_widths:
+        sampled = 0
+        for rows, sample in chunks:
+            parsed.append(rows)
+            for line, row in sample[:SAMPLE_ROWS - sampled]:
+                reader.widen(line, row)
+            sampled += len(sample)
+            if sampled >= SAMPLE_ROWS:
+                break
+
+    return pooled_rows(pool, parsed, chunks)
+
+
+def ordered_results(pool, tasks, window):
+    # Parsed chunks in input order, with at most window of them submitted
+    # ahead, so only that many chunks' rows are held at once
+    tasks = iter(tasks)
+    pending = deque(pool.submit(parse_chunk, task)
+                    for task in itertools.islice(tasks, window))
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for task in itertools.islice(tasks, 1):
+                pending.append(pool.submit(parse_chunk, task))
+            yield result
+    finally:
+        # Stopped early, e.g. by --limit, so skip the chunks not yet started
+        for future in pending:
+            future.cancel()
+
+
+def pooled_rows(pool, parsed, chunks):
+    try:
+        for rows in itertools.chain(parsed, (rows for rows, _ in chunks)):
+            yield from rows
+    finally:
+        chunks.close()
+        pool.shutdown()
@@ -0,0 +1,543 @@
+from array import array
+from collections.abc import Sequence
+import bz2
+import csv
+import gzip
+import io
+import itertools
+import json
+import lzma
+import mmap
+import os
+import re
+import sys
+
+from tsel.where import comparator, pattern_test
+
+multiple_spaces = re.compile('  +')
+
+# Rows used to size CSV columns before streaming output starts
+SAMPLE_ROWS = 1000
+
+# Lines looked at to work out the input format, and the columns of formats
+# without a header line
+SNIFF_LINES = 100
+
+logfmt_pairs = re.compile(r'([^\s="]+)=("(?:[^"\\]|\\.)*"|[^\s"]*)')
+# Leading bytes of compressed input, and the modules that decompress it
+MAGIC = {b'\x1f\x8b': gzip, b'BZh': bz2, b'\xfd7zXZ\x00': lzma}
+
+whitespace = re.compile(r'\s*')
+logfmt_line = re.compile(r'(?:[^\s="]+=(?:"(?:[^"\\]|\\.)*"|[^\s"]*)(?:\s+|$))+')
+
+
+def read_lines(infile):
+    if infile == '-':
+        module = decompressor(getattr(sys.stdin, 'buffer', None))
+        if module is None:
+            file = sys.stdin
+        else:
+            file = module.open(sys.stdin.buffer, 'rt', encoding='UTF-8')
+        for line in file:
+            yield line.rstrip('\r\n')
+    else:
+        with open(infile, 'rb') as binary:
+            module = decompressor(binary)
+            if module is None:
+                file = io.TextIOWrapper(binary, encoding='UTF-8')
+            else:
+                file = module.open(binary, 'rt', encoding='UTF-8')
+            with file:
+                for line in file:
+                    yield line.rstrip('\r\n')
+
+
+def decompressor(file):
+    # Module that decompresses file, going by its first bytes, or None
+    if not hasattr(file, 'peek'):
+        return None
+    head = file.peek(len(max(MAGIC, key=len)))
+    for magic, module in MAGIC.items():
+        if head.startswith(magic):
+            return module
+    return None
+
+
+def compressed(infile):
+    with open(infile, 'rb') as file:
+        return decompressor(file) is not None
+
+
+def is_json_document(lines):
+    objects = [line for line in lines if line.strip()]
+    if not objects or objects[0].lstrip()[:1] not in ('{', '['):
+        return False
+    if not JsonLinesReader.sniff(lines):
+        return True
+    # A lone object with an items array, like `jq -c` of kubectl output
+    return (len(objects) == 1 and
+            isinstance(json.loads(objects[0]).get('items'), list))
+
+
+def json_items(lines):
+    # Items of the JSON values in lines, parsed incrementally so only one
+    # item at a time is held. Arrays are read item by item, as is the "items"
+    # array of an object like `kubectl get -o json` output. An object
+    # without items is a single item.
+    decoder = json.JSONDecoder()
+    lines = iter(lines)
+    buf = ''
+    pos = 0
+
+    def more():
+        # Read at least as much again as is buffered, so values spanning many
+        # lines are only parsed a few times over
+        nonlocal buf, pos
+        wanted = max(len(buf) - pos, 1 << 12)
+        read = list(itertools.islice(lines, 64))
+        size = sum(map(len, read))
+        while read and size < wanted:
+            chunk = list(itertools.islice(lines, 64))
+            if not chunk:
+                break
+            read.extend(chunk)
+            size += sum(map(len, chunk))
+        buf = buf[pos:] + '\n'.join(read) + '\n' if read else buf[pos:]
+        pos = 0
+        return bool(read)
+
+    def peek():
+        nonlocal pos
+        while True:
+            pos = whitespace.match(buf, pos).end()
+            if pos < len(buf) or not more():
+                return buf[pos:pos + 1]
+
+    def value():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if more():
+                    continue
+                raise
+            start, pos = pos, end
+            return item, buf[start:end]
+
+    def array():
+        nonlocal pos
+        pos += 1
+        if peek() == ']':
+            pos += 1
+            return
+        while True:
+            _, text = value()
+            # Strings can't hold raw newlines, so this is still valid JSON
+            yield text.replace('\n', ' ')
+            c = peek()
+            pos += 1
+            if c == ']':
+                return
+            if c != ',':
+                raise ValueError("Expected ',' or ']' in JSON array")
+
+    def members():
+        nonlocal pos
+        pos += 1
+        rest = dict()
+        found = False
+        if peek() == '}':
+            pos += 1
+        else:
+            while True:
+                key, _ = value()
+                if not isinstance(key, str) or peek() != ':':
+                    raise ValueError("Expected a key and ':' in JSON object")
+                pos += 1
+                if key == 'items' and peek() == '[':
+                    found = True
+                    yield from array()
+                else:
+                    rest[key], _ = value()
+                c = peek()
+                pos += 1
+                if c == '}':
+                    break
+                if c != ',':
+                    raise ValueError("Expected ',' or '}' in JSON object")
+
+        if not found:
+            yield json.dumps(rest)
+
+    while True:
+        c = peek()
+        if not c:
+            return
+        if c == '[':
+            yield from array()
+        elif c == '{':
+            yield from members()
+        else:
+            raise ValueError(f"Expected a JSON object or array, found '{c}'")
+
+
+def map_lines(infile):
+    if infile == '-' or not os.path.isfile(infile):
+        return None
+    if os.path.getsize(infile) == 0 or compressed(infile):
+        return None
+    return LineIndex(infile)
+
+
+class LineIndex(Sequence):
+    """Lines of a memory-mapped file, decoded on demand from their offsets"""
+
+    def __init__(self, infile):
+        # Absolute, so a cached index maps the same file from any directory
+        self.infile = os.path.abspath(infile)
+        self.map()
+
+        mm = self.mm
+        size = len(mm)
+
+        nl = mm.find(b'\n')
+        if nl < 0:
+            nl = size
+        self.headerline = mm[:nl].decode('UTF-8').rstrip('\r')
+
+        offsets = array('q')
+        max_length = 0
+        find = mm.find
+        pos = nl + 1
+        while pos < size:
+            offsets.append(pos)
+            nl = find(b'\n', pos)
+            if nl < 0:
+                nl = size
+            if nl - pos > max_length:
+                max_length = nl - pos
+            pos = nl + 1
+        # Sentinel, so line i is mm[offsets[i]:offsets[i + 1] - 1]
+        offsets.append(pos)
+
+        self.offsets = offsets
+        self.max_length = max_length
+
+    def map(self):
+        with open(self.infile, 'rb') as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __getstate__(self):
+        # Pickled without the mapping, the file is mapped again on load
+        state = self.__dict__.copy()
+        del state['mm']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.map()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start = self.offsets[i]
+        stop = self.offsets[i + 1] - 1
+        return self.mm[start:stop].decode('UTF-8').rstrip('\r')
+
+
+def open_reader(lines):
+    # Pick a reader for the input from its first few lines
+    for reader in READERS:
+        if reader.sniff(lines):
+            break
+    reader = reader(lines)
+
+    if not len(reader.names) == len(set(reader.names)):
+        raise NotImplementedError("Duplicate column names not supported")
+
+    return reader
+
+
+class TabularReader:
+    sample_widths = True
+    random_access = True
+    header_lines = 1
+    multiline_records = False
+
+    @staticmethod
+    def sniff(lines):
+        return bool(lines) and len(multiple_spaces.split(lines[0])) > 1
+
+    def __init__(self, lines):
+        headerline = lines[0]
+        self.headerline = headerline
+        self.names = multiple_spaces.split(headerline)
+
+        # Work out column name => (start, end) character indices. The last
+        # column runs to the end of each line, however long it is.
+        self.slices = []
+        start = 0
+        for i, c in enumerate(self.names):
+            if i + 1 < len(self.names):
+                stop = headerline.index(self.names[i + 1], start + len(c))
+            else:
+                stop = None
+            self.slices.append((start, stop))
+            start = stop
+
+        # Display width of the last column, widened to fit the data
+        self.max_length = len(headerline)
+
+    def line_test(self, where):
+        # Where clause tested on a raw line, before it's split into a row
+        col, cmp, val = where
+
+        if col is None:
+            return pattern_test(cmp, val)
+
+        start, stop = self.slices[self.names.index(col)]
+        test = comparator(cmp, val)
+        return lambda line: test(line[start:stop].strip())
+
+    def record_test(self, where):
+        # Where clause tested on a (line, row) record of all columns
+        col, cmp, val = where
+
+        if col is None:
+            test = pattern_test(cmp, val)
+            return lambda record: test(record[0])
+
+        index = self.names.index(col)
+        test = comparator(cmp, val)
+        return lambda record: test(record[1][index])
+
+    def row(self, line):
+        return LazyRow(line, self.slices)
+
+    def column(self, lines, index):
+        start, stop = self.slices[index]
+        return (line[start:stop].strip() for line in lines)
+
+    def rows(self, lines, indexes=None):
+        # Rows hold the columns at indexes, or all of them
+        if indexes is None:
+            slices = self.slices
+        else:
+            slices = [self.slices[i] for i in indexes]
+        for line in lines:
+            yield line, [line[start:stop].strip() for start, stop in slices]
+
+    def widen(self, line, row):
+        self.widen_to(len(line))
+
+    def widen_to(self, length):
+        # Get last column width from data
+        if length > self.max_length:
+            self.max_length = length
+
+    def layout(self):
+        # column[column_name] = (index, start, stop)
+        columns = dict()
+        for index, c in enumerate(self.names):
+            start, stop = self.slices[index]
+            columns[c] = (index, start, stop)
+        columns[c] = (index, start, self.max_length + 2)
+        return columns
+
+
+class LazyRow(Sequence):
+    """Fields of a fixed width line, each stripped the first time it's read"""
+
+    __slots__ = ('line', 'slices', 'cells')
+
+    def __init__(self, line, slices):
+        self.line = line
+        self.slices = slices
+        self.cells = [None] * len(slices)
+
+    def __len__(self):
+        return len(self.slices)
+
+    def __getitem__(self, index):
+        cell = self.cells[index]
+        if cell is None:
+            start, stop = self.slices[index]
+            cell = self.cells[index] = self.line[start:stop].strip()
+        return cell
+
+
+class RecordReader:
+    """Rows parsed record by record, with column widths sized from the data"""
+
+    sample_widths = True
+    random_access = False
+    header_lines = 1
+    multiline_records = False
+
+    def record_test(self, where):
+        # Where clause tested on a (line, row) record
+        col, cmp, val = where
+
+        if col is None:
+            test = pattern_test(cmp, val)
+            return lambda record: test(record[0])
+
+        index = self.names.index(col)
+        test = comparator(cmp, val)
+        return lambda record: test(record[1][index])
+
+    def widen(self, line, row):
+        widths = self.widths
+        for index, value in enumerate(row):
+            if len(value) + 2 > widths[index]:
+                widths[index] = len(value) + 2
+
+    def layout(self):
+        return {name: (index, 0, self.widths[index])
+                for index, name in enumerate(self.names)}
+
+
+class CsvReader(RecordReader):
+    # Quoted fields may span lines, so rows can't be read from single lines
+    multiline_records = True
+    delimiter = ','
+
+    @staticmethod
+    def sniff(lines):
+        return True
+
+    def __init__(self, lines):
+        self.headerline = lines[0] if lines else ''
+        self.names = next(csv.reader([self.headerline],
+                                     delimiter=self.delimiter), [])
+        self.widths = [len(name) + 2 for name in self.names]
+
+    def rows(self, lines):
+        consumed = []
+
+        def track():
+            for line in lines:
+                consumed.append(line)
+                yield line
+
+        size = len(self.names)
+        for row in csv.reader(track(), delimiter=self.delimiter):
+            line = '\n'.join(consumed)
+            consumed.clear()
+            if not row:
+                continue
+            if len(row) < size:
+                row.extend([''] * (size - len(row)))
+            elif len(row) > size:
+                del row[size:]
+            yield line, row
+
+
+class TsvReader(CsvReader):
+    delimiter = '\t'
+
+    @staticmethod
+    def sniff(lines):
+        return bool(lines) and '\t' in lines[0]
+
+
+def flatten(obj, prefix='', record=None):
+    # Nested objects become dotted column names, e.g. metadata.name
+    if record is None:
+        record = dict()
+    for key, value in obj.items():
+        if isinstance(value, dict) and value:
+            flatten(value, f'{prefix}{key}.', record)
+        else:
+            record[f'{prefix}{key}'] = json_value(value)
+    return record
+
+
+def json_value(value):
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return ''
+    return json.dumps(value)
+
+
+class KeyValueReader(RecordReader):
+    """Records of key/value pairs, columns are the keys in the first lines"""
+
+    header_lines = 0
+
+    def __init__(self, lines):
+        self.headerline = ''
+        names = dict()
+        for line in lines:
+            if line.strip():
+                names.update(dict.fromkeys(self.parse(line)))
+        self.names = list(names)
+        self.widths = [len(name) + 2 for name in self.names]
+
+    def rows(self, lines, grow=False):
+        # With grow, keys first seen after the sniffed lines become new
+        # columns, otherwise they are left out
+        names = self.names
+        known = set(names)
+        parse = self.parse
+        for line in lines:
+            if not line.strip():
+                continue
+            record = parse(line)
+            if grow and not known.issuperset(record):
+                for key in record:
+                    if key not in known:
+                        known.add(key)
+                        names.append(key)
+                        self.widths.append(len(key) + 2)
+            yield line, [record.get(name, '') for name in names]
+
+
+class JsonLinesReader(KeyValueReader):
+
+    @staticmethod
+    def sniff(lines):
+        objects = [line for line in lines if line.strip()]
+        if not objects or not objects[0].lstrip().startswith('{'):
+            return False
+        try:
+            return all(isinstance(json.loads(line), dict) for line in objects)
+        except ValueError:
+            return False
+
+    @staticmethod
+    def parse(line):
+        return flatten(json.loads(line))
+
+
+class LogfmtReader(KeyValueReader):
+
+    @staticmethod
+    def sniff(lines):
+        records = [line.strip() for line in lines if line.strip()]
+        return bool(records) and all(
+            logfmt_line.fullmatch(line) and len(logfmt_pairs.findall(line)) > 1
+            for line in records)
+
+    @staticmethod
+    def parse(line):
+        record = dict()
+        for key, value in logfmt_pairs.findall(line):
+            if value.startswith('"'):
+                value = re.sub(r'\\(.)', r'\1', value[1:-1])
+            record[key] = value
+        return record
+
+
+# Tried in order, the first reader that recognises the input reads it
+READERS = [JsonLinesReader, LogfmtReader, TsvReader, TabularReader, CsvReader]
@@ -0,0 +1,163 @@
+import heapq
+import itertools
+import pickle
+import tempfile
+
+from tsel.where import natural_key
+
+
+# Rough bytes a row of n cells takes in memory, on top of the text itself
+ROW_OVERHEAD = 64
+CELL_OVERHEAD = 57
+
+# Smallest --sort-memory used, smaller budgets just spill more files
+MIN_SORT_MEMORY = 1 << 20
+
+# Runs merged at once, each holding a temporary file open
+MERGE_RUNS = 64
+
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_size(size):
+    # "256M" => 268435456
+    size = size.strip().upper().rstrip('B')
+    unit = SIZE_UNITS.get(size[-1:], 1)
+    if unit > 1:
+        size = size[:-1]
+    return int(size) * unit
+
+
+def parse_order(order_by):
+    # "STATUS,-RESTARTS" => [('STATUS', False), ('RESTARTS', True)]
+    order = []
+    for name in order_by.split(','):
+        name = name.strip()
+        if name.startswith('-'):
+            order.append((name[1:], True))
+        else:
+            order.append((name.lstrip('+'), False))
+    return order
+
+
+def format_order(order):
+    return ",".join(f"-{name}" if descending else name
+                    for name, descending in order)
+
+
+class Descending:
+    """Sort key wrapper that orders its key in reverse"""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def sort_key(getters):
+    # getters are (get, descending) pairs, get(row) returning a column's key.
+    # Returns (key, reverse) for sorted(), wrapping keys only when the
+    # columns don't all sort in the same direction.
+    directions = set(descending for _, descending in getters)
+    reverse = directions == {True}
+
+    if len(getters) == 1:
+        return getters[0][0], reverse
+
+    if len(directions) == 1:
+        gets = [get for get, _ in getters]
+        return (lambda row: tuple(get(row) for get in gets)), reverse
+
+    def key(row):
+        return tuple(Descending(get(row)) if descending else get(row)
+                     for get, descending in getters)
+    return key, False
+
+
+def row_getter(index):
+    return lambda row: natural_key(row[index])
+
+
+def order_rows(rows, key, reverse, limit=None):
+    if limit is None:
+        return sorted(rows, key=key, reverse=reverse)
+
+    # Only the first limit rows are wanted, so keep a bounded heap of them
+    # instead of sorting everything
+    if reverse:
+        return heapq.nlargest(limit, rows, key=key)
+    return heapq.nsmallest(limit, rows, key=key)
+
+
+def external_sort(rows, key, reverse, budget):
+    # Sort runs that fit the memory budget, spill each to a temporary file
+    # and merge them back, so inputs larger than memory can be sorted
+    levels = []
+    run = []
+    size = 0
+    for row in rows:
+        run.append(row)
+        size += ROW_OVERHEAD + sum(CELL_OVERHEAD + len(c) for c in row)
+        if size >= budget:
+            add_run(levels, spill(sorted(run, key=key, reverse=reverse)),
+                    key, reverse)
+            run = []
+            size = 0
+
+    run.sort(key=key, reverse=reverse)
+    if not levels:
+        yield from run
+        return
+
+    add_run(levels, spill(run), key, reverse)
+    del run
+
+    # Earlier rows are in higher levels, merging runs in input order keeps
+    # the sort stable
+    runs = [file for level in reversed(levels) for file in level]
+    while len(runs) > MERGE_RUNS:
+        runs = [spill(merge_runs(runs[i:i + MERGE_RUNS], key, reverse))
+                for i in range(0, len(runs), MERGE_RUNS)]
+    yield from merge_runs(runs, key, reverse)
+
+
+def add_run(levels, file, key, reverse):
+    # Every MERGE_RUNS runs of a level are merged into one run of the next,
+    # so only a few files per level are open at once
+    for level in itertools.count():
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(file)
+        if len(levels[level]) < MERGE_RUNS:
+            return
+        file = spill(merge_runs(levels[level], key, reverse))
+        levels[level] = []
+
+
+def merge_runs(files, key, reverse):
+    return heapq.merge(*[unspill(file) for file in files],
+                       key=key, reverse=reverse)
+
+
+def spill(rows):
+    file = tempfile.TemporaryFile()
+    # Pickle rows one at a time, so nothing is memoised across rows
+    for row in rows:
+        pickle.dump(row, file, pickle.HIGHEST_PROTOCOL)
+    file.seek(0)
+    return file
+
+
+def unspill(file):
+    with file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
@@ -0,0 +1,264 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+import itertools
+
+from tsel.where import natural_key
+
+# Distinct values a column may collect before encoding it has to pay off
+MIN_CODES = 1024
+
+# Lazily split rows kept around for redrawing, a few screens' worth
+ROW_CACHE = 4096
+
+
+class DictColumn(Sequence):
+    """Column stored as an array of codes into a list of its distinct values"""
+
+    def __init__(self):
+        self.values = []
+        self.lookup = dict()
+        # Appending a code that doesn't fit raises OverflowError
+        self.codes = array('H')
+        self.sort_keys = []
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rid):
+        if isinstance(rid, slice):
+            return [self.values[code] for code in self.codes[rid]]
+        return self.values[self.codes[rid]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[code] for code in self.codes)
+
+    def append(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            if code >= MIN_CODES and code * 2 > len(self.codes):
+                raise OverflowError("Column has too many distinct values")
+            self.codes.append(code)
+            self.lookup[value] = code
+            self.values.append(value)
+        else:
+            self.codes.append(code)
+
+    def code(self, value):
+        return self.lookup.get(value, -1)
+
+    def keys(self):
+        # Natural sort key of each distinct value, indexed by code
+        if len(self.sort_keys) < len(self.values):
+            self.sort_keys = [natural_key(v) for v in self.values]
+        return self.sort_keys
+
+
+def encode(values):
+    column = DictColumn()
+    values = iter(values)
+    for value in values:
+        try:
+            column.append(value)
+        except OverflowError:
+            # Too many distinct values for encoding to pay off
+            cells = list(column)
+            cells.append(value)
+            cells.extend(values)
+            return cells
+    return column
+
+
+class SortedIndex:
+    """Row ids in natural sort order, grouped by distinct sort key"""
+
+    def __init__(self, rids, key):
+        self.rids = array('q', rids)
+        # Rows with keys[i] are rids[starts[i]:starts[i + 1]]
+        self.keys = []
+        self.starts = array('q')
+        for i, rid in enumerate(self.rids):
+            k = key(rid)
+            if not self.keys or k != self.keys[-1]:
+                self.keys.append(k)
+                self.starts.append(i)
+        self.starts.append(len(self.rids))
+
+    def range(self, cmp, val):
+        key = natural_key(val)
+        if cmp == '<':
+            lo, hi = 0, bisect_left(self.keys, key)
+        elif cmp == '<=':
+            lo, hi = 0, bisect_right(self.keys, key)
+        elif cmp == '>':
+            lo, hi = bisect_right(self.keys, key), len(self.keys)
+        elif cmp == '>=':
+            lo, hi = bisect_left(self.keys, key), len(self.keys)
+        else:
+            raise ValueError(f"Unknown comparitor '{cmp}'")
+        return self.rids[self.starts[lo]:self.starts[hi]]
+
+    def ordered(self, descending=False):
+        if not descending:
+            return self.rids
+        # Keep equal rows in their original order, as a stable sort would
+        rids = array('q')
+        for i in reversed(range(len(self.keys))):
+            rids.extend(self.rids[self.starts[i]:self.starts[i + 1]])
+        return rids
+
+    def ranks(self):
+        # Position of each row's key among the distinct keys, by row id
+        ranks = array('q', bytes(8 * len(self.rids)))
+        rids = self.rids
+        for rank in range(len(self.keys)):
+            for i in range(self.starts[rank], self.starts[rank + 1]):
+                ranks[rids[i]] = rank
+        return ranks
+
+
+class Table:
+    """Column-oriented row store, rows are addressed by integer row id"""
+
+    def __init__(self, names, lines=None, reader=None):
+        self.names = list(names)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.reader = reader
+
+        if lines is None:
+            # Rows are appended as they are read
+            self.lines = []
+            self.cells = [DictColumn() for _ in self.names]
+        else:
+            # Columns are split out of the lines the first time they are used
+            self.lines = lines
+            self.cells = [None for _ in self.names]
+
+        self.sort_keys = dict()
+        self.inverted = dict()
+        self.sorted_indexes = dict()
+        self.rank_cache = dict()
+        self.rows = dict()
+
+    def __getstate__(self):
+        # Rows split for display aren't worth keeping
+        state = self.__dict__.copy()
+        del state['rows']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rows = dict()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def extend(self, names):
+        # New columns, empty for the rows already appended
+        for name in names:
+            self.positions[name] = len(self.names)
+            self.names.append(name)
+            self.cells.append(encode(itertools.repeat('', len(self.lines))))
+
+    def append(self, line, row):
+        self.lines.append(line)
+        for i, value in enumerate(row):
+            try:
+                self.cells[i].append(value)
+            except OverflowError:
+                self.cells[i] = list(self.cells[i])
+                self.cells[i].append(value)
+
+    def column(self, name):
+        i = self.positions[name]
+        if self.cells[i] is None:
+            self.cells[i] = encode(self.reader.column(self.lines, i))
+        return self.cells[i]
+
+    def keys(self, name):
+        # Natural sort key of each row, computed the first time it's needed
+        if name not in self.sort_keys:
+            self.sort_keys[name] = [natural_key(c) for c in self.column(name)]
+        return self.sort_keys[name]
+
+    def key_getter(self, name):
+        cells = self.column(name)
+        if isinstance(cells, DictColumn):
+            keys = cells.keys()
+            codes = cells.codes
+            return lambda rid: keys[codes[rid]]
+        return self.keys(name).__getitem__
+
+    def postings(self, name, value):
+        # Ascending ids of the rows holding value, from an inverted index
+        # built the first time the column is looked up
+        if name not in self.inverted:
+            cells = self.column(name)
+            if isinstance(cells, DictColumn):
+                by_code = [array('q') for _ in cells.values]
+                for rid, code in enumerate(cells.codes):
+                    by_code[code].append(rid)
+                index = dict(zip(cells.values, by_code))
+            else:
+                index = dict()
+                for rid, cell in enumerate(cells):
+                    if cell not in index:
+                        index[cell] = array('q')
+                    index[cell].append(rid)
+            self.inverted[name] = index
+        return self.inverted[name].get(value, array('q'))
+
+    def sorted_index(self, name):
+        if name not in self.sorted_indexes:
+            cells = self.column(name)
+            if isinstance(cells, DictColumn):
+                # Concatenate each distinct key's rows, in key order
+                keys = cells.keys()
+                rids = array('q')
+                codes = sorted(range(len(keys)), key=keys.__getitem__)
+                for _, group in itertools.groupby(codes, key=keys.__getitem__):
+                    postings = [self.postings(name, cells.values[c]) for c in group]
+                    if len(postings) == 1:
+                        rids.extend(postings[0])
+                    else:
+                        rids.extend(sorted(itertools.chain(*postings)))
+            else:
+                keys = self.keys(name)
+                rids = sorted(range(len(keys)), key=keys.__getitem__)
+            self.sorted_indexes[name] = SortedIndex(rids, self.key_getter(name))
+        return self.sorted_indexes[name]
+
+    def ranks(self, name):
+        # Integer sort keys, equal for rows that sort equal
+        if name not in self.rank_cache:
+            self.rank_cache[name] = self.sorted_index(name).ranks()
+        return self.rank_cache[name]
+
+    def distinct(self, name):
+        cells = self.column(name)
+        if isinstance(cells, DictColumn):
+            return set(cells.values)
+        return set(cells)
+
+    def cell(self, rid, name):
+        i = self.positions[name]
+        cells = self.cells[i]
+        if cells is None:
+            return self.row(rid)[i]
+        return cells[rid]
+
+    def row(self, rid):
+        # Fields of columns that haven't been split out yet, read from the
+        # line as they are used
+        row = self.rows.get(rid)
+        if row is None:
+            if len(self.rows) >= ROW_CACHE:
+                self.rows.clear()
+            row = self.rows[rid] = self.reader.row(self.lines[rid])
+        return row
+
+    def select(self, rids, names):
+        for rid in rids:
+            yield [self.cell(rid, name) for name in names]
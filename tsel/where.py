@@ -0,0 +1,310 @@
+from functools import lru_cache, reduce
+import re
+
+comparitors = re.compile('(<>|<=?|>=?|!=|!~|==?|~)')
+numeric = re.compile('([0-9]+)')
+# Parentheses, or runs of anything else with quoted parts kept whole
+words = re.compile(r"""\(|\)|(?:[^\s()"']|"[^"]*"|'[^']*')+""")
+
+KEYWORDS = ('and', 'or', 'not')
+
+# Comparitors the table indexes can answer without scanning rows
+INDEXED = ('=', '==', '!=', '<>', '<', '<=', '>', '>=')
+REGEX = ('~', '!~')
+
+
+@lru_cache(maxsize=4096)
+def natural_key(s):
+    # Digit runs compare as numbers (4 < 10, not '4' < '10')
+    parts = numeric.split(s)
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+
+def key_test(cmp, val):
+    key = natural_key(val)
+    if cmp == '<':
+        return key.__gt__
+    elif cmp == '<=':
+        return key.__ge__
+    elif cmp == '>':
+        return key.__lt__
+    elif cmp == '>=':
+        return key.__le__
+
+    raise ValueError(f"Unknown comparitor '{cmp}'")
+
+
+def required_literal(pattern):
+    # Longest plain substring every match of pattern has to contain, or ''
+    # when that isn't obvious (alternation, flags, groups, classes ...)
+    if '|' in pattern or '(?' in pattern:
+        return ''
+
+    runs = []
+    run = ''
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        literal = None
+        if c == '\\' and i + 1 < len(pattern):
+            i += 1
+            if pattern[i] in 'xuUN' or pattern[i].isdigit():
+                # Character codes and group references, the characters
+                # after them aren't literal
+                return ''
+            if not pattern[i].isalnum():
+                literal = pattern[i]
+        elif c == '[':
+            i = class_end(pattern, i)
+            if i < 0:
+                return ''
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c in '*?{':
+            # The previous character is optional
+            run = run[:-1]
+            if c == '{':
+                i = max(i, pattern.find('}', i))
+        elif c not in '.^$+':
+            literal = c
+
+        if literal is not None and depth == 0:
+            run += literal
+        else:
+            runs.append(run)
+            run = ''
+        i += 1
+
+    runs.append(run)
+    return max(runs, key=len)
+
+
+def class_end(pattern, i):
+    # Index of the ']' closing the character class opened at i, or -1
+    i += 1
+    if pattern[i:i + 1] == '^':
+        i += 1
+    if pattern[i:i + 1] == ']':
+        # A leading ']' is part of the class
+        i += 1
+    while i < len(pattern):
+        if pattern[i] == '\\':
+            i += 1
+        elif pattern[i] == ']':
+            return i
+        i += 1
+    return -1
+
+
+def regex_test(cmp, val):
+    pattern = re.compile(val)
+    search = pattern.search
+    literal = required_literal(val)
+
+    if literal:
+        # A substring check is much cheaper than running the regex
+        def test(cell):
+            return literal in cell and search(cell) is not None
+    else:
+        def test(cell):
+            return search(cell) is not None
+
+    if cmp == '!~':
+        return lambda cell: not test(cell)
+    return test
+
+
+def comparator(cmp, val):
+    if cmp == '=' or cmp == '==':
+        return val.__eq__
+    elif cmp == '!=' or cmp == '<>':
+        return val.__ne__
+    elif cmp in REGEX:
+        return regex_test(cmp, val)
+
+    test = key_test(cmp, val)
+    return lambda cell: test(natural_key(cell))
+
+
+def pattern_test(cmp, val):
+    # A pattern (None, None, text) matches text anywhere in the line, a group
+    # of them (None, 'or'|'and', texts) is matched with one combined regex
+    if cmp is None:
+        return lambda line: val in line
+
+    patterns = sorted(set(val), key=len, reverse=True)
+    alternatives = '|'.join(map(re.escape, patterns))
+    if cmp == 'or':
+        search = re.compile(alternatives).search
+        return lambda line: search(line) is not None
+
+    # The lookahead finds the longest pattern starting at each position, any
+    # shorter one starting there is part of it
+    findall = re.compile(f'(?=({alternatives}))').findall
+    parts = {p: frozenset(q for q in patterns if q in p) for p in patterns}
+    longest = patterns[0]
+
+    def test(line):
+        if longest not in line:
+            return False
+        found = set()
+        for match in set(findall(line)):
+            found |= parts[match]
+        return len(found) == len(patterns)
+    return test
+
+
+def both(first, second):
+    return lambda record: first(record) and second(record)
+
+
+def compile_where(tests):
+    # Clauses are ANDed, evaluation stops at the first one that fails
+    if not tests:
+        return lambda record: True
+    return reduce(both, tests)
+
+
+def either(first, second):
+    return lambda record: first(record) or second(record)
+
+
+def compile_node(where, compile_clause):
+    # Where clauses are (col, cmp, val) tuples, col is None for patterns
+    # matched against the whole line. Expressions combine them as
+    # ('and', wheres), ('or', wheres) or ('not', where).
+    if is_clause(where):
+        return compile_clause(where)
+
+    op, arg = where
+    if op == 'not':
+        test = compile_node(arg, compile_clause)
+        return lambda record: not test(record)
+
+    # Patterns are matched together, in one pass over the line
+    patterns = [w[2] for w in arg if is_pattern(w)]
+    if len(patterns) > 1:
+        arg = [(None, op, tuple(patterns))] + [w for w in arg if not is_pattern(w)]
+
+    tests = [compile_node(w, compile_clause) for w in arg]
+    if op == 'and':
+        return compile_where(tests)
+    return reduce(either, tests)
+
+
+def is_clause(where):
+    return len(where) == 3
+
+
+def is_pattern(where):
+    return is_clause(where) and where[0] is None and where[1] is None
+
+
+def clauses(where):
+    if is_clause(where):
+        yield where
+    elif where[0] == 'not':
+        yield from clauses(where[1])
+    else:
+        for w in where[1]:
+            yield from clauses(w)
+
+
+def unquote(text):
+    if len(text) > 1 and text[0] == text[-1] and text[0] in '"\'':
+        return text[1:-1]
+    return text
+
+
+def parse_clause(text, quoted=False):
+    parts = comparitors.split(text, 1)
+    if len(parts) == 1:
+        return (None, None, unquote(text) if quoted else text)
+    col, cmp, val = parts
+    if quoted:
+        return (unquote(col), cmp, unquote(val))
+    return (col, cmp, val)
+
+
+def parse_where(text):
+    tokens = words.findall(text)
+
+    # Plain COL=Value and pattern filters are taken as is, spaces and all
+    if not tokens or not (tokens[0] == '(' or any(t in KEYWORDS for t in tokens)):
+        return parse_clause(text)
+
+    parser = WhereParser(tokens)
+    where = parser.expression()
+    if parser.peek() is not None:
+        raise ValueError(f"Unexpected '{parser.peek()}' in --where '{text}'")
+    return where
+
+
+class WhereParser:
+    """Recursive descent parser for and/or/not where expressions"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of --where expression")
+        self.pos += 1
+        return token
+
+    def expression(self):
+        wheres = [self.conjunction()]
+        while self.peek() == 'or':
+            self.take()
+            wheres.append(self.conjunction())
+        return wheres[0] if len(wheres) == 1 else ('or', tuple(wheres))
+
+    def conjunction(self):
+        wheres = [self.negation()]
+        while self.peek() == 'and':
+            self.take()
+            wheres.append(self.negation())
+        return wheres[0] if len(wheres) == 1 else ('and', tuple(wheres))
+
+    def negation(self):
+        token = self.take()
+        if token == 'not':
+            return ('not', self.negation())
+        if token == '(':
+            where = self.expression()
+            if self.take() != ')':
+                raise ValueError("Missing ')' in --where expression")
+            return where
+        if token in KEYWORDS or token == ')':
+            raise ValueError(f"Unexpected '{token}' in --where expression")
+        return parse_clause(token, quoted=True)
+
+
+def format_where(where, nested=False):
+    if is_clause(where):
+        col, cmp, val = where
+        if nested and words.fullmatch(val) is None:
+            val = f'"{val}"'
+        if nested and col is not None and words.fullmatch(col) is None:
+            col = f'"{col}"'
+        if col is None:
+            return val
+        return f'{col}{cmp}{val}'
+
+    op, arg = where
+    if op == 'not':
+        return f'not {format_where(arg, True)}'
+
+    text = f' {op} '.join(format_where(w, True) for w in arg)
+    return f'({text})' if nested else text